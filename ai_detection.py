@@ -1,10 +1,11 @@
 """
 AI-based engagement detection using transcription analysis.
 """
-import os
-import sys
-import subprocess
+import re
 import time
+from collections import Counter
+
+import numpy as np
 
 try:
     from tqdm import tqdm
@@ -13,7 +14,159 @@ except ImportError:
     HAS_TQDM = False
 
 from config import AI_MIN_SCORE, MAX_DURATION, WHISPER_MODEL
-from subtitle_utils import format_time, estimate_transcribe_time
+from subtitle_utils import (
+    format_time, estimate_transcribe_time, load_whisper_model, read_audio_stream,
+    TRANSCRIBE_OPTIONS
+)
+from youtube_utils import get_audio_url, Marker
+
+
+# Indonesian & English excitement keywords
+EXCITEMENT_KEYWORDS = [
+    # ======================
+    # PODCAST – Reactions & Opinions
+    # ======================
+    "wah", "wow", "gila", "parah", "ngeri", "sadis", "kacau",
+    "menarik", "unik", "mindblowing", "dalem banget",
+    "kena banget", "relate", "jujur", "asli", "sumpah",
+    "gue setuju", "gue gak setuju", "menurut gue",
+    "fakta", "realita", "realistis", "kenyataan",
+    "berat nih", "panas nih", "ini serius",
+    "plot twist", "unexpected", "di luar dugaan",
+
+    # Podcast – Story / Insight Hooks
+    "tahu gak", "tau gak", "pernah kepikiran",
+    "pernah ngalamin", "pernah denger",
+    "coba bayangin", "bayangkan",
+    "kenapa bisa", "kok bisa",
+    "menariknya", "yang bikin kaget",
+    "yang jarang dibahas", "yang orang gak sadar",
+    "masalahnya", "intinya", "point pentingnya",
+
+    # ======================
+    # GAMING – Hype & Reactions
+    # ======================
+    "anjay", "anjir", "buset", "gilak", "gokil",
+    "auto panik", "auto kaget", "auto ngakak",
+    "pecah", "meledak", "rusuh", "chaos",
+    "clutch", "epic", "legendary", "insane",
+    "crazy", "no way", "holy", "wtf",
+    "clean", "perfect", "smooth",
+
+    # Gaming – Gameplay Moments
+    "headshot", "one tap", "one shot",
+    "ace", "wipe", "team wipe",
+    "gg", "ggwp", "ez", "ez win",
+    "throw", "blunder", "fail",
+    "outplay", "comeback", "turnaround",
+    "last second", "detik terakhir",
+    "sisa satu", "tinggal satu",
+
+    # ======================
+    # UNIVERSAL – Engagement Hooks
+    # ======================
+    "lihat ini", "coba lihat",
+    "percaya gak", "siap-siap",
+    "fokus", "dengerin",
+    "tunggu", "bentar",
+    "gimana menurut lo", "menurut kalian",
+
+    # ======================
+    # Emphasis / Intensifier (High Signal)
+    # ======================
+    "banget", "parah banget", "gila banget",
+    "sangat", "sekali",
+    "bener-bener", "serius",
+    "really", "very", "so", "extremely",
+    "literally", "totally"
+]
+
+# Question patterns (engagement hooks)
+QUESTION_MARKERS = (
+    "?", "gimana", "bagaimana", "kenapa", "mengapa",
+    "how", "what", "why", "tahu gak", "tau gak"
+)
+
+
+# Tokens keep inner hyphens so keywords like "siap-siap" stay one word
+_TOKEN_RE = re.compile(r"[\w-]+")
+
+# Single words are looked up in the segment's token set; phrases are matched
+# against the space-joined token sequence, padded so only whole words match
+_KW_SINGLE = frozenset(k for k in EXCITEMENT_KEYWORDS if " " not in k)
+_KW_MULTI = [f" {k} " for k in EXCITEMENT_KEYWORDS if " " in k]
+_QM_SINGLE = frozenset(m for m in QUESTION_MARKERS if " " not in m and m != "?")
+_QM_MULTI = [f" {m} " for m in QUESTION_MARKERS if " " in m]
+
+
+def match_keywords(text):
+    """
+    Return (keyword_count, has_question) for a lowercased segment text.
+    Keywords and question markers only match whole words,
+    so e.g. "wow" does not match inside "powow".
+    """
+    tokens = _TOKEN_RE.findall(text)
+    token_set = set(tokens)
+    joined = f" {' '.join(tokens)} "
+    
+    keyword_count = len(_KW_SINGLE & token_set) + sum(1 for phrase in _KW_MULTI if phrase in joined)
+    has_question = (
+        "?" in text
+        or not _QM_SINGLE.isdisjoint(token_set)
+        or any(phrase in joined for phrase in _QM_MULTI)
+    )
+    return keyword_count, has_question
+
+
+def max_word_repeat(words):
+    """
+    Return how often the most repeated word (longer than 3 characters) occurs.
+    Counting stops at 4, where the repetition score is already capped.
+    """
+    counts = Counter()
+    for word in words:
+        if len(word) > 3:  # Ignore short words
+            counts[word] += 1
+            if counts[word] >= 4:
+                return 4
+    return counts.most_common(1)[0][1] if counts else 1
+
+
+def score_segments(durations, keyword_counts, has_questions, max_repeats, word_counts):
+    """
+    Compute engagement scores (0.0-1.0) from per-segment feature arrays.
+    """
+    scores = np.zeros(durations.shape[0], dtype=np.float64)
+
+    # 1. Excitement keywords (weight: 0.4)
+    scores += np.minimum(0.4, keyword_counts * 0.1)
+
+    # 2. Question patterns (weight: 0.2)
+    scores += np.where(has_questions, 0.2, 0.0)
+
+    # 3. Repetition detection (weight: 0.15)
+    scores += np.minimum(0.15, (max_repeats - 1) * 0.05) * (max_repeats >= 2)
+
+    # 4. Optimal duration (weight: 0.15)
+    # Clips between 5-30 seconds are most engaging
+    scores += np.where(
+        (durations >= 5) & (durations <= 30), 0.15,
+        np.where((durations >= 3) & (durations <= 45), 0.10,
+                 np.where((durations >= 1) & (durations <= 60), 0.05, 0.0))
+    )
+
+    # 5. Text density (weight: 0.1)
+    # Higher word count per second = more engaging
+    words_per_sec = word_counts / durations
+    scores += np.where(
+        (words_per_sec >= 2) & (words_per_sec <= 5), 0.1,  # Optimal speaking pace
+        np.where((words_per_sec >= 1) & (words_per_sec <= 6), 0.05, 0.0)
+    )
+
+    # Normalize score to 0.0-1.0
+    scores = np.minimum(1.0, scores)
+    
+    return scores
 
 
 def analyze_engagement_from_subtitle(segments):
@@ -31,133 +184,50 @@ def analyze_engagement_from_subtitle(segments):
     if not segments:
         return []
     
-    # Indonesian & English excitement keywords
-    excitement_keywords = [
-        # ======================
-        # PODCAST – Reactions & Opinions
-        # ======================
-        "wah", "wow", "gila", "parah", "ngeri", "sadis", "kacau",
-        "menarik", "unik", "mindblowing", "dalem banget",
-        "kena banget", "relate", "jujur", "asli", "sumpah",
-        "gue setuju", "gue gak setuju", "menurut gue",
-        "fakta", "realita", "realistis", "kenyataan",
-        "berat nih", "panas nih", "ini serius",
-        "plot twist", "unexpected", "di luar dugaan",
-
-        # Podcast – Story / Insight Hooks
-        "tahu gak", "tau gak", "pernah kepikiran",
-        "pernah ngalamin", "pernah denger",
-        "coba bayangin", "bayangkan",
-        "kenapa bisa", "kok bisa",
-        "menariknya", "yang bikin kaget",
-        "yang jarang dibahas", "yang orang gak sadar",
-        "masalahnya", "intinya", "point pentingnya",
-
-        # ======================
-        # GAMING – Hype & Reactions
-        # ======================
-        "anjay", "anjir", "buset", "gilak", "gokil",
-        "auto panik", "auto kaget", "auto ngakak",
-        "pecah", "meledak", "rusuh", "chaos",
-        "clutch", "epic", "legendary", "insane",
-        "crazy", "no way", "holy", "wtf",
-        "clean", "perfect", "smooth",
-
-        # Gaming – Gameplay Moments
-        "headshot", "one tap", "one shot",
-        "ace", "wipe", "team wipe",
-        "gg", "ggwp", "ez", "ez win",
-        "throw", "blunder", "fail",
-        "outplay", "comeback", "turnaround",
-        "last second", "detik terakhir",
-        "sisa satu", "tinggal satu",
-
-        # ======================
-        # UNIVERSAL – Engagement Hooks
-        # ======================
-        "lihat ini", "coba lihat",
-        "percaya gak", "siap-siap",
-        "fokus", "dengerin",
-        "tunggu", "bentar",
-        "gimana menurut lo", "menurut kalian",
-
-        # ======================
-        # Emphasis / Intensifier (High Signal)
-        # ======================
-        "banget", "parah banget", "gila banget",
-        "sangat", "sekali",
-        "bener-bener", "serius",
-        "really", "very", "so", "extremely",
-        "literally", "totally"
-    ]
+    starts = np.fromiter((segment.start for segment in segments), dtype=np.float64, count=len(segments))
+    ends = np.fromiter((segment.end for segment in segments), dtype=np.float64, count=len(segments))
+    durations = ends - starts
     
-    results = []
+    # Skip very short or very long segments
+    valid = np.flatnonzero((durations >= 1) & (durations <= MAX_DURATION))
+    if valid.size == 0:
+        return []
     
-    for i, segment in enumerate(segments):
-        text = segment.text.lower().strip()
-        start = segment.start
-        end = segment.end
-        duration = end - start
-        
-        # Skip very short or very long segments
-        if duration < 1 or duration > MAX_DURATION:
-            continue
-        
-        score = 0.0
-        
-        # 1. Excitement keywords (weight: 0.4)
-        keyword_count = sum(1 for keyword in excitement_keywords if keyword in text)
-        if keyword_count > 0:
-            score += min(0.4, keyword_count * 0.1)
-        
-        # 2. Question patterns (weight: 0.2)
-        question_markers = ["?", "gimana", "bagaimana", "kenapa", "mengapa", 
-                           "how", "what", "why", "tahu gak", "tau gak"]
-        if any(marker in text for marker in question_markers):
-            score += 0.2
-        
-        # 3. Repetition detection (weight: 0.15)
-        words = text.split()
-        if len(words) > 3:
-            word_freq = {}
-            for word in words:
-                if len(word) > 3:  # Ignore short words
-                    word_freq[word] = word_freq.get(word, 0) + 1
-            max_repeat = max(word_freq.values()) if word_freq else 1
-            if max_repeat >= 2:
-                score += min(0.15, (max_repeat - 1) * 0.05)
-        
-        # 4. Optimal duration (weight: 0.15)
-        # Clips between 5-30 seconds are most engaging
-        if 5 <= duration <= 30:
-            score += 0.15
-        elif 3 <= duration <= 45:
-            score += 0.10
-        elif 1 <= duration <= 60:
-            score += 0.05
-        
-        # 5. Text density (weight: 0.1)
-        # Higher word count per second = more engaging
-        words_per_sec = len(words) / duration if duration > 0 else 0
-        if 2 <= words_per_sec <= 5:  # Optimal speaking pace
-            score += 0.1
-        elif 1 <= words_per_sec <= 6:
-            score += 0.05
-        
-        # Normalize score to 0.0-1.0
-        score = min(1.0, score)
-        
-        # Only include segments above threshold
-        if score >= AI_MIN_SCORE:
-            results.append({
-                "start": start,
-                "duration": min(duration, MAX_DURATION),
-                "score": score,
-                "method": "ai_subtitle"
-            })
+    starts = starts[valid]
+    durations = durations[valid]
+    
+    # Text features are gathered per segment, scoring below runs on whole arrays.
+    # Helpers are bound to locals so the comprehensions avoid global lookups.
+    match = match_keywords
+    repeat = max_word_repeat
+    
+    texts = [segments[i].text.lower().strip() for i in valid]
+    word_lists = [text.split() for text in texts]
+    matches = [match(text) for text in texts]
+    
+    keyword_counts = np.array([count for count, _ in matches], dtype=np.int32)
+    has_questions = np.array([question for _, question in matches], dtype=bool)
+    word_counts = np.array([len(words) for words in word_lists], dtype=np.int32)
+    max_repeats = np.array(
+        [repeat(words) if len(words) > 3 else 1 for words in word_lists],
+        dtype=np.int32
+    )
     
-    # Sort by score descending
-    results.sort(key=lambda x: x["score"], reverse=True)
+    scores = score_segments(durations, keyword_counts, has_questions, max_repeats, word_counts)
+    
+    # Only include segments above threshold, sorted by score descending
+    selected = np.flatnonzero(scores >= AI_MIN_SCORE)
+    selected = selected[np.argsort(-scores[selected], kind="stable")]
+    
+    results = [
+        Marker(
+            float(starts[j]),
+            float(min(durations[j], MAX_DURATION)),
+            float(scores[j]),
+            "ai_subtitle"
+        )
+        for j in selected
+    ]
     
     return results
 
@@ -165,7 +235,9 @@ def analyze_engagement_from_subtitle(segments):
 def detect_engagement_ai(video_id, total_duration):
     """
     Detect high-engagement segments using AI transcription analysis.
-    Downloads full video audio, transcribes, and analyzes for engagement.
+    Streams the full video audio, transcribes, and analyzes for engagement.
+    Returns (results, segments) so the full transcript can be reused
+    for clip subtitles.
     """
     print("\n   Heatmap data not available.")
     print("   Falling back to AI-based engagement detection...")
@@ -174,32 +246,16 @@ def detect_engagement_ai(video_id, total_duration):
     # Ask user confirmation
     confirm = input("\nProceed with AI analysis? (y/n): ").strip().lower()
     if confirm not in ["y", "yes"]:
-        return []
-    
-    temp_audio = "temp_full_audio.mp4"
+        return [], []
     
     try:
-        # Download audio only (faster than full video)
-        print("\n   Downloading audio track...")
-        cmd_audio = [
-            sys.executable, "-m", "yt_dlp",
-            "--force-ipv4",
-            "--quiet", "--no-warnings",
-            "-f", "bestaudio[ext=m4a]/bestaudio",
-            "-o", temp_audio,
-            f"https://youtu.be/{video_id}"
-        ]
-        
-        subprocess.run(
-            cmd_audio,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
+        # Stream audio only (faster than full video), decoded in memory for Whisper
+        print("\n   Streaming audio track...")
+        audio = read_audio_stream(get_audio_url(video_id))
         
-        if not os.path.exists(temp_audio):
+        if audio.size == 0:
             print("❌ Failed to download audio.")
-            return []
+            return [], []
         
         # Transcribe with Whisper
         print("\n   Transcribing full video with AI...")
@@ -209,12 +265,11 @@ def detect_engagement_ai(video_id, total_duration):
         estimated_time = estimate_transcribe_time(total_duration, WHISPER_MODEL)
         print(f"   Estimated time: ~{format_time(estimated_time)}")
         
-        from faster_whisper import WhisperModel
-        model = WhisperModel(WHISPER_MODEL, device="cpu", compute_type="int8")
+        model = load_whisper_model()
         
         # Start transcription with progress tracking
         start_time = time.time()
-        segments, info = model.transcribe(temp_audio, language=None)
+        segments, info = model.transcribe(audio, language=None, **TRANSCRIBE_OPTIONS)
         
         # Collect segments with progress bar
         segments_list = []
@@ -264,25 +319,14 @@ def detect_engagement_ai(video_id, total_duration):
         print("   Analyzing segments for engagement patterns...")
         results = analyze_engagement_from_subtitle(segments_list)
         
-        # Cleanup
-        if os.path.exists(temp_audio):
-            os.remove(temp_audio)
-        
         if results:
             print(f"✅ Found {len(results)} high-engagement segments using AI analysis!")
-            print(f"   Top score: {results[0]['score']:.2f}")
+            print(f"   Top score: {results[0].score:.2f}")
         else:
             print("⚠️  No high-engagement segments detected by AI.")
         
-        return results
+        return results, segments_list
         
     except Exception as e:
-        # Cleanup on error
-        if os.path.exists(temp_audio):
-            try:
-                os.remove(temp_audio)
-            except:
-                pass
-        
         print(f"❌ AI analysis failed: {str(e)}")
-        return []
+        return [], []
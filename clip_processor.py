@@ -2,273 +2,283 @@
 Clip processing utilities for downloading, cropping, and exporting clips.
 """
 import os
-import sys
 import subprocess
 
 from config import (
-    OUTPUT_DIR, PADDING, TOP_HEIGHT, BOTTOM_HEIGHT, 
+    OUTPUT_DIR, PADDING, TOP_HEIGHT, BOTTOM_HEIGHT, VIDEO_ENCODER,
     WATERMARK_FILE, WATERMARK_WIDTH_PERCENT, WATERMARK_PADDING_X, WATERMARK_PADDING_Y
 )
-from subtitle_utils import generate_subtitle
+from subtitle_utils import generate_subtitle, slice_srt
 
+SUBTITLE_STYLE = (
+    "FontName=Arial,FontSize=12,Bold=1,PrimaryColour=&HFFFFFF,OutlineColour=&H000000,"
+    "BorderStyle=1,Outline=2,Shadow=1,MarginV=100"
+)
+
+# Hardware H.264 encoders, in order of preference
+HW_ENCODERS = ["h264_nvenc", "h264_qsv", "h264_videotoolbox"]
+
+_VENC = None
+
+
+def remove_file(path):
+    """
+    Delete a temporary file, ignoring it if it does not exist.
+    """
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def venc_args(encoder):
+    """
+    Build FFmpeg video encoder arguments with roughly CRF 26 quality.
+    """
+    if encoder == "h264_nvenc":
+        return ["-c:v", encoder, "-preset", "p4", "-rc", "vbr", "-cq", "26"]
+    if encoder == "h264_qsv":
+        return ["-c:v", encoder, "-preset", "veryfast", "-global_quality", "26"]
+    if encoder == "h264_videotoolbox":
+        return ["-c:v", encoder, "-q:v", "60"]
+    return ["-c:v", encoder, "-preset", "ultrafast", "-crf", "26"]
+
+
+def _encoder_works(encoder):
+    """
+    Check that an encoder can actually run, since FFmpeg builds list
+    hardware encoders even when no matching GPU is present.
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", "color=black:s=256x256:d=0.1",
+        "-frames:v", "1",
+        *venc_args(encoder),
+        "-f", "null", "-"
+    ]
+    try:
+        return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+    except OSError:
+        return False
+
+
+def get_video_encoder():
+    """
+    Pick the H.264 encoder for clips, preferring hardware encoders.
+    The probe runs once and the result is cached.
+    """
+    global _VENC
+    if _VENC is None:
+        if VIDEO_ENCODER != "auto":
+            _VENC = VIDEO_ENCODER
+        else:
+            _VENC = "libx264"
+            try:
+                available = subprocess.run(
+                    ["ffmpeg", "-hide_banner", "-encoders"],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    text=True
+                ).stdout
+            except OSError:
+                available = ""
+
+            for encoder in HW_ENCODERS:
+                if encoder in available and _encoder_works(encoder):
+                    _VENC = encoder
+                    break
+    return _VENC
+
+
+def build_crop_filter(crop_mode):
+    """
+    Build the filter graph that turns input 0 into a 720x1280 frame labelled [v].
+    """
+    if crop_mode == "split_left":
+        # Split crop:
+        # - Top: konten game dari tengah-tengah video (960px)
+        # - Bottom: facecam dari kiri bawah video asli (320px)
+        return (
+            f"[0:v]scale=-2:1280,split=2[s1][s2];"
+            f"[s1]crop=720:{TOP_HEIGHT}:(iw-720)/2:(ih-1280)/2[top];"
+            f"[s2]crop=720:{BOTTOM_HEIGHT}:0:ih-{BOTTOM_HEIGHT}[bottom];"
+            f"[top][bottom]vstack=inputs=2[v]"
+        )
+    if crop_mode == "split_right":
+        # Split crop:
+        # - Top: konten game dari tengah-tengah video (960px)
+        # - Bottom: facecam dari kanan bawah video asli (320px)
+        return (
+            f"[0:v]scale=-2:1280,split=2[s1][s2];"
+            f"[s1]crop=720:{TOP_HEIGHT}:(iw-720)/2:(ih-1280)/2[top];"
+            f"[s2]crop=720:{BOTTOM_HEIGHT}:iw-720:ih-{BOTTOM_HEIGHT}[bottom];"
+            f"[top][bottom]vstack=inputs=2[v]"
+        )
+    # Standard center crop - ambil dari tengah video
+    return "[0:v]scale=-2:1280,crop=720:1280:(iw-720)/2:(ih-1280)/2[v]"
+
+
+def clip_window(item, total_duration):
+    """
+    Return the padded (start, end) of a segment, clamped to the video length.
+    """
+    start = max(0, item.start - PADDING)
+    end = min(item.start + item.duration + PADDING, total_duration)
+    return start, end
+
+
+def buat_subtitle_clip(source_file, item, index, total_duration, full_segments=None):
+    """
+    Write the subtitle file of a single clip.
+
+    Runs in the main process, so one Whisper model (using every core)
+    serves all clips instead of one model per worker process.
+
+    Args:
+        source_file: local copy of the full source video
+        full_segments: transcript of the whole video; when given, the clip
+            subtitle is sliced from it instead of re-running Whisper
 
-def proses_satu_clip(video_id, item, index, total_duration, crop_mode="default", use_subtitle=False):
+    Returns the subtitle file path, or None if no subtitle could be made.
     """
-    Download, crop, and export a single vertical clip
+    start, end = clip_window(item, total_duration)
+    if end - start < 3:
+        return None
+
+    audio_file = f"temp_{index}.wav"
+    subtitle_file = f"temp_{index}.srt"
+
+    print(f"[Clip {index}] Generating subtitle...")
+    if full_segments is not None:
+        subtitle_ok = slice_srt(full_segments, start, end, subtitle_file)
+    else:
+        # Only the clip's audio is needed for transcription
+        cmd_audio = [
+            "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+            "-ss", str(start), "-to", str(end),
+            "-i", source_file,
+            "-vn", "-ac", "1", "-ar", "16000",
+            audio_file
+        ]
+        try:
+            subprocess.run(
+                cmd_audio,
+                check=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE
+            )
+            subtitle_ok = generate_subtitle(audio_file, subtitle_file)
+        except subprocess.CalledProcessError:
+            # No audio for Whisper; the clip is still exported without subtitle
+            subtitle_ok = False
+        remove_file(audio_file)
+
+    if not subtitle_ok:
+        remove_file(subtitle_file)
+        print(f"[Clip {index}] Subtitle generation failed, continuing without subtitle...")
+        return None
+    return subtitle_file
+
+
+def proses_satu_clip(source_file, item, index, total_duration, crop_mode="default",
+                     subtitle_file=None, encoder="libx264"):
+    """
+    Cut, crop, and export a single vertical clip
     based on a heatmap segment.
-    
+
+    The segment is cut from the downloaded source video and cropped,
+    subtitled and watermarked in a single FFmpeg encode.
+
     Args:
+        source_file: local copy of the full source video
         crop_mode: "default", "split_left", or "split_right"
-        use_subtitle: whether to generate and burn subtitle
+        subtitle_file: SRT made by buat_subtitle_clip to burn in, or None
+        encoder: H.264 encoder picked once by get_video_encoder
     """
-    start_original = item["start"]
-    end_original = item["start"] + item["duration"]
-
-    start = max(0, start_original - PADDING)
-    end = min(end_original + PADDING, total_duration)
+    start, end = clip_window(item, total_duration)
 
     if end - start < 3:
         return False
 
-    temp_file = f"temp_{index}.mp4"
-    cropped_file = f"temp_cropped_{index}.mp4"
-    subtitle_file = f"temp_{index}.srt"
     output_file = os.path.join(OUTPUT_DIR, f"clip_{index}.mp4")
+    subtitle_ok = subtitle_file is not None
 
     print(
         f"[Clip {index}] Processing segment "
         f"({int(start)}s - {int(end)}s, padding {PADDING}s)"
     )
 
-    cmd_download = [
-        sys.executable, "-m", "yt_dlp",
-        "--force-ipv4",
-        "--quiet", "--no-warnings",
-        "--downloader", "ffmpeg",
-        "--downloader-args",
-        f"ffmpeg_i:-ss {start} -to {end} -hide_banner -loglevel error",
-        "-f",
-        "bestvideo[height<=1080][ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best",
-        "-o", temp_file,
-        f"https://youtu.be/{video_id}"
-    ]
-
     try:
-        result = subprocess.run(
-            cmd_download,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-
-        if not os.path.exists(temp_file):
-            print("Failed to download video segment.")
-            return False
-
-        # Build video filter based on crop_mode
-        # First, crop the video to cropped_file
-        if crop_mode == "default":
-            # Standard center crop - ambil dari tengah video
-            cmd_crop = [
-                "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-                "-i", temp_file,
-                "-vf", "scale=-2:1280,crop=720:1280:(iw-720)/2:(ih-1280)/2",
-                "-c:v", "libx264", "-preset", "ultrafast", "-crf", "26",
-                "-c:a", "aac", "-b:a", "128k",
-                cropped_file
-            ]
-        elif crop_mode == "split_left":
-            # Split crop: 
-            # - Top: konten game dari tengah-tengah video (960px)
-            # - Bottom: facecam dari kiri bawah video asli (320px)
-            vf = (
-                f"scale=-2:1280[scaled];"
-                f"[scaled]split=2[s1][s2];"
-                f"[s1]crop=720:{TOP_HEIGHT}:(iw-720)/2:(ih-1280)/2[top];"
-                f"[s2]crop=720:{BOTTOM_HEIGHT}:0:ih-{BOTTOM_HEIGHT}[bottom];"
-                f"[top][bottom]vstack=inputs=2[out]"
-            )
-            cmd_crop = [
-                "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-                "-i", temp_file,
-                "-filter_complex", vf,
-                "-map", "[out]", "-map", "0:a?",
-                "-c:v", "libx264", "-preset", "ultrafast", "-crf", "26",
-                "-c:a", "aac", "-b:a", "128k",
-                cropped_file
-            ]
-        elif crop_mode == "split_right":
-            # Split crop: 
-            # - Top: konten game dari tengah-tengah video (960px)
-            # - Bottom: facecam dari kanan bawah video asli (320px)
-            vf = (
-                f"scale=-2:1280[scaled];"
-                f"[scaled]split=2[s1][s2];"
-                f"[s1]crop=720:{TOP_HEIGHT}:(iw-720)/2:(ih-1280)/2[top];"
-                f"[s2]crop=720:{BOTTOM_HEIGHT}:iw-720:ih-{BOTTOM_HEIGHT}[bottom];"
-                f"[top][bottom]vstack=inputs=2[out]"
-            )
-            cmd_crop = [
-                "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-                "-i", temp_file,
-                "-filter_complex", vf,
-                "-map", "[out]", "-map", "0:a?",
-                "-c:v", "libx264", "-preset", "ultrafast", "-crf", "26",
-                "-c:a", "aac", "-b:a", "128k",
-                cropped_file
-            ]
-
-        print("  Cropping video...")
-        result = subprocess.run(
-            cmd_crop,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-
-        os.remove(temp_file)
-
         # Check if watermark file exists
         watermark_exists = os.path.exists(WATERMARK_FILE)
         if not watermark_exists:
             print(f"  Warning: Watermark file '{WATERMARK_FILE}' not found. Proceeding without watermark.")
 
-        # Generate and burn subtitle if enabled
-        if use_subtitle:
-            print("  Generating subtitle...")
-            if generate_subtitle(cropped_file, subtitle_file):
-                print("  Burning subtitle" + (" and adding watermark..." if watermark_exists else "..."))
-                # Get absolute paths
-                abs_subtitle_path = os.path.abspath(subtitle_file)
-                
-                # Escape for FFmpeg: replace \ with / and escape special chars
-                subtitle_path = abs_subtitle_path.replace("\\", "/").replace(":", "\\:")
-                
-                if watermark_exists:
-                    # Combine subtitle and watermark filters
-                    # Scale watermark based on video width percentage, then overlay
-                    vf = (
-                        f"[0:v]subtitles='{subtitle_path}':force_style='FontName=Arial,FontSize=12,Bold=1,PrimaryColour=&HFFFFFF,OutlineColour=&H000000,BorderStyle=1,Outline=2,Shadow=1,MarginV=100'[sub];"
-                        f"[1:v]scale=iw*{WATERMARK_WIDTH_PERCENT}:-1[wm];"
-                        f"[sub][wm]overlay=W-w-{WATERMARK_PADDING_X}:H-h-{WATERMARK_PADDING_Y}[out]"
-                    )
-                    
-                    cmd_subtitle = [
-                        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-                        "-i", cropped_file,
-                        "-i", WATERMARK_FILE,
-                        "-filter_complex", vf,
-                        "-map", "[out]", "-map", "0:a?",
-                        "-c:v", "libx264", "-preset", "ultrafast", "-crf", "26",
-                        "-c:a", "copy",
-                        output_file
-                    ]
-                else:
-                    # Subtitle only, no watermark
-                    cmd_subtitle = [
-                        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-                        "-i", cropped_file,
-                        "-vf", f"subtitles='{subtitle_path}':force_style='FontName=Arial,FontSize=12,Bold=1,PrimaryColour=&HFFFFFF,OutlineColour=&H000000,BorderStyle=1,Outline=2,Shadow=1,MarginV=100'",
-                        "-c:v", "libx264", "-preset", "ultrafast", "-crf", "26",
-                        "-c:a", "copy",
-                        output_file
-                    ]
-                
-                result = subprocess.run(
-                    cmd_subtitle,
-                    check=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                
-                os.remove(cropped_file)
-                os.remove(subtitle_file)
-            else:
-                # If subtitle generation failed, add watermark only (if exists)
-                if watermark_exists:
-                    print("  Subtitle generation failed, adding watermark...")
-                    # Scale watermark based on video width percentage
-                    vf_wm = f"[1:v]scale=iw*{WATERMARK_WIDTH_PERCENT}:-1[wm];[0:v][wm]overlay=W-w-{WATERMARK_PADDING_X}:H-h-{WATERMARK_PADDING_Y}[out]"
-                    cmd_watermark = [
-                        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-                        "-i", cropped_file,
-                        "-i", WATERMARK_FILE,
-                        "-filter_complex", vf_wm,
-                        "-map", "[out]", "-map", "0:a?",
-                        "-c:v", "libx264", "-preset", "ultrafast", "-crf", "26",
-                        "-c:a", "copy",
-                        output_file
-                    ]
-                    
-                    result = subprocess.run(
-                        cmd_watermark,
-                        check=True,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True
-                    )
-                    
-                    os.remove(cropped_file)
-                else:
-                    # No subtitle and no watermark, just rename
-                    os.rename(cropped_file, output_file)
+        # Build the full filter graph: crop -> subtitle -> watermark
+        filters = [build_crop_filter(crop_mode)]
+        video_label = "[v]"
+
+        if subtitle_ok:
+            # Get absolute paths
+            abs_subtitle_path = os.path.abspath(subtitle_file)
+
+            # Escape for FFmpeg: replace \ with / and escape special chars
+            subtitle_path = abs_subtitle_path.replace("\\", "/").replace(":", "\\:")
+            filters.append(
+                f"{video_label}subtitles='{subtitle_path}':force_style='{SUBTITLE_STYLE}'[sub]"
+            )
+            video_label = "[sub]"
+
+        cmd_inputs = ["-ss", str(start), "-to", str(end), "-i", source_file]
+
+        if watermark_exists:
+            cmd_inputs += ["-i", WATERMARK_FILE]
+            # Scale watermark based on video width percentage, then overlay
+            filters.append(f"[1:v]scale=iw*{WATERMARK_WIDTH_PERCENT}:-1[wm]")
+            filters.append(
+                f"{video_label}[wm]overlay=W-w-{WATERMARK_PADDING_X}:H-h-{WATERMARK_PADDING_Y}[out]"
+            )
+            video_label = "[out]"
+
+        if subtitle_ok or watermark_exists:
+            print(
+                "  Cropping video"
+                + (", burning subtitle" if subtitle_ok else "")
+                + (" and adding watermark" if watermark_exists else "")
+                + "..."
+            )
         else:
-            # No subtitle, add watermark only (if exists)
-            if watermark_exists:
-                print("  Adding watermark...")
-                # Scale watermark based on video width percentage
-                vf_wm = f"[1:v]scale=iw*{WATERMARK_WIDTH_PERCENT}:-1[wm];[0:v][wm]overlay=W-w-{WATERMARK_PADDING_X}:H-h-{WATERMARK_PADDING_Y}[out]"
-                cmd_watermark = [
-                    "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-                    "-i", cropped_file,
-                    "-i", WATERMARK_FILE,
-                    "-filter_complex", vf_wm,
-                    "-map", "[out]", "-map", "0:a?",
-                    "-c:v", "libx264", "-preset", "ultrafast", "-crf", "26",
-                    "-c:a", "copy",
-                    output_file
-                ]
-                
-                result = subprocess.run(
-                    cmd_watermark,
-                    check=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                
-                os.remove(cropped_file)
-            else:
-                # No subtitle and no watermark, just rename
-                os.rename(cropped_file, output_file)
+            print("  Cropping video...")
+
+        cmd_encode = [
+            "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+            *cmd_inputs,
+            "-filter_complex", ";".join(filters),
+            "-map", video_label, "-map", "0:a?",
+            *venc_args(encoder),
+            "-c:a", "aac", "-b:a", "128k",
+            output_file
+        ]
+
+        subprocess.run(
+            cmd_encode,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
 
         print("Clip successfully generated.")
         return True
 
     except subprocess.CalledProcessError as e:
-        # Cleanup temp files
-        for f in [temp_file, cropped_file, subtitle_file]:
-            if os.path.exists(f):
-                try:
-                    os.remove(f)
-                except Exception:
-                    pass
-
         print(f"Failed to generate this clip.")
-        print(f"Error details: {e.stderr if e.stderr else e.stdout}")
+        # FFmpeg runs with -loglevel error, so stderr only holds the failure reason
+        print(f"Error details: {e.stderr.decode(errors='replace') if e.stderr else e}")
         return False
     except Exception as e:
-        # Cleanup temp files
-        for f in [temp_file, cropped_file, subtitle_file]:
-            if os.path.exists(f):
-                try:
-                    os.remove(f)
-                except Exception:
-                    pass
-
         print(f"Failed to generate this clip.")
         print(f"Error: {str(e)}")
         return False
+    finally:
+        if subtitle_ok:
+            remove_file(subtitle_file)
@@ -1,17 +1,23 @@
 """
 Configuration constants for YouTube Heatmap Clipper.
 """
+import os
 
 # Output settings
 OUTPUT_DIR = "clips"      # Directory where generated clips will be saved
 MAX_CLIPS = 10            # Maximum number of clips to generate per video
-MAX_WORKERS = 1           # Number of parallel workers (reserved for future concurrency)
+MAX_WORKERS = min(4, os.cpu_count() or 1)  # Number of clips processed in parallel
+CACHE_DIR = os.path.expanduser("~/.cache/yt-heatmap-clipper")  # Local cache for run metadata
+CACHE_EXPIRE = 6 * 60 * 60  # Seconds before cached heatmap/duration lookups are refreshed
 
 # Clip settings
 MAX_DURATION = 60         # Maximum duration (in seconds) for each clip
 MIN_SCORE = 0.40          # Minimum heatmap intensity score to be considered viral
 PADDING = 10              # Extra seconds added before and after each detected segment
 
+# Encoder settings
+VIDEO_ENCODER = "auto"    # "auto" (use GPU encoder if available), or e.g. "libx264", "h264_nvenc"
+
 # Crop settings
 TOP_HEIGHT = 960          # Height for top section (center content) in split mode
 BOTTOM_HEIGHT = 320       # Height for bottom section (facecam) in split mode
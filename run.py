@@ -9,40 +9,56 @@ Generated clips are optimized for TikTok/Shorts format with optional subtitles.
 """
 import os
 import sys
+import time
 import subprocess
 import shutil
 import warnings
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 warnings.filterwarnings("ignore")
 
 # Import configurations
 from config import (
-    OUTPUT_DIR, MAX_CLIPS, PADDING, WHISPER_MODEL,
+    OUTPUT_DIR, MAX_CLIPS, MAX_WORKERS, CACHE_DIR, PADDING, WHISPER_MODEL,
     USE_AI_FALLBACK
 )
 
 # Import utilities
-from youtube_utils import extract_video_id, get_duration, ambil_most_replayed
+from youtube_utils import extract_video_id, get_duration, ambil_most_replayed, download_source
 from subtitle_utils import get_model_size
 from ai_detection import detect_engagement_ai
-from clip_processor import proses_satu_clip
+from clip_processor import proses_satu_clip, buat_subtitle_clip, get_video_encoder, remove_file
+
+SOURCE_FILE = "source_full.mp4"
+YT_DLP_UPGRADE_STAMP = os.path.join(CACHE_DIR, "yt-dlp-upgrade.stamp")
+YT_DLP_UPGRADE_INTERVAL = 24 * 60 * 60  # Upgrade yt-dlp at most once per day
 
 
 def cek_dependensi(install_whisper=False):
     """
     Ensure required dependencies are available.
-    Automatically updates yt-dlp and checks FFmpeg availability.
+    Automatically updates yt-dlp (at most once per day) and checks FFmpeg availability.
     """
-    subprocess.run(
-        [sys.executable, "-m", "pip", "install", "-U", "yt-dlp"],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL
-    )
+    if (
+        not os.path.exists(YT_DLP_UPGRADE_STAMP)
+        or time.time() - os.path.getmtime(YT_DLP_UPGRADE_STAMP) > YT_DLP_UPGRADE_INTERVAL
+    ):
+        subprocess.run(
+            [sys.executable, "-m", "pip", "install", "-U", "yt-dlp"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(YT_DLP_UPGRADE_STAMP, "w"):
+                pass
+        except OSError:
+            pass
 
     if install_whisper:
-        # Check if faster-whisper package is installed
-        try:
-            import faster_whisper
+        # Check if faster-whisper package is installed (without importing it)
+        if importlib.util.find_spec("faster_whisper") is not None:
             print(f"✅ Faster-Whisper package installed.")
             
             # Check if selected model is cached
@@ -64,7 +80,7 @@ def cek_dependensi(install_whisper=False):
                 print(f"      Will auto-download ~{get_model_size(WHISPER_MODEL)} on first transcribe.")
                 print(f"      Download happens only once, then cached for future use.\n")
                 
-        except ImportError:
+        else:
             print("   Installing Faster-Whisper package...")
             subprocess.run(
                 [sys.executable, "-m", "pip", "install", "faster-whisper"],
@@ -131,10 +147,14 @@ def main():
         print("Invalid YouTube link.")
         return
 
-    # Get video duration first (needed for both heatmap and AI fallback)
+    heatmap_data = ambil_most_replayed(video_id, top_k=MAX_CLIPS)
+    
+    # Video duration (needed for both heatmap and AI fallback);
+    # usually already known from the heatmap page fetch
     total_duration = get_duration(video_id)
     
-    heatmap_data = ambil_most_replayed(video_id)
+    # Full-video transcript, reused for clip subtitles when available
+    full_segments = None
 
     # Fallback to AI-based detection if heatmap unavailable
     if not heatmap_data:
@@ -144,7 +164,9 @@ def main():
                 print("\n⚠️  AI fallback requires Whisper. Enabling temporarily...")
                 cek_dependensi(install_whisper=True)
             
-            heatmap_data = detect_engagement_ai(video_id, total_duration)
+            heatmap_data, transcript = detect_engagement_ai(video_id, total_duration)
+            if use_subtitle:
+                full_segments = transcript
             
             if not heatmap_data:
                 print("\n❌ No high-engagement segments found (heatmap or AI).")
@@ -165,19 +187,45 @@ def main():
 
     success_count = 0
 
-    for item in heatmap_data:
-        if success_count >= MAX_CLIPS:
-            break
+    # Probe the encoder once here rather than in every worker process
+    encoder = get_video_encoder()
+
+    try:
+        # Download the source once; every clip is then cut locally.
+        # Inside the try, so a partial or failed download is still removed.
+        print("Downloading source video...")
+        if not download_source(video_id, SOURCE_FILE):
+            print("Failed to download source video.")
+            return
 
-        if proses_satu_clip(
-            video_id,
-            item,
-            success_count + 1,
-            total_duration,
-            crop_mode,
-            use_subtitle
-        ):
-            success_count += 1
+        # Clips are independent, so each one runs its own FFmpeg in a worker process.
+        # Subtitles are made here first, so a single Whisper model serves every clip
+        # while earlier clips are already encoding.
+        with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = []
+            for index, item in enumerate(heatmap_data[:MAX_CLIPS], start=1):
+                subtitle_file = None
+                if use_subtitle:
+                    subtitle_file = buat_subtitle_clip(
+                        SOURCE_FILE, item, index, total_duration, full_segments
+                    )
+
+                futures.append(executor.submit(
+                    proses_satu_clip,
+                    SOURCE_FILE,
+                    item,
+                    index,
+                    total_duration,
+                    crop_mode,
+                    subtitle_file,
+                    encoder
+                ))
+
+            for future in as_completed(futures):
+                if future.result():
+                    success_count += 1
+    finally:
+        remove_file(SOURCE_FILE)
 
     print(
         f"Finished processing. "
@@ -1,8 +1,12 @@
 """
 Subtitle generation utilities using Faster-Whisper.
 """
+import os
+import subprocess
 import time
 
+import numpy as np
+
 try:
     from tqdm import tqdm
     HAS_TQDM = True
@@ -11,6 +15,63 @@ except ImportError:
 
 from config import WHISPER_MODEL
 
+# Shared transcription settings: skip silence with VAD and use greedy decoding
+TRANSCRIBE_OPTIONS = {
+    "vad_filter": True,
+    "vad_parameters": {"min_silence_duration_ms": 500},
+    "beam_size": 1,
+    "condition_on_previous_text": False,
+}
+
+_MODEL = None
+
+
+def load_whisper_model():
+    """
+    Load the Faster-Whisper model once and reuse it for every transcription.
+    The model is only read from disk on the first call of the process.
+    """
+    global _MODEL
+    if _MODEL is None:
+        from faster_whisper import WhisperModel
+
+        print(f"  Loading Faster-Whisper model '{WHISPER_MODEL}'...")
+        print(f"  (If this is first time, downloading ~{get_model_size(WHISPER_MODEL)}...)")
+        # Use int8 for CPU efficiency, or "float16" for GPU
+        _MODEL = WhisperModel(
+            WHISPER_MODEL,
+            device="cpu",
+            compute_type="int8",
+            cpu_threads=os.cpu_count() or 0,
+            num_workers=1
+        )
+        print("  ✅ Model loaded.")
+    return _MODEL
+
+
+def read_audio_stream(url):
+    """
+    Decode an audio URL with FFmpeg straight into the 16 kHz mono float32
+    array Whisper expects, without writing an intermediate file.
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", url,
+        "-vn", "-ac", "1", "-ar", "16000",
+        "-f", "s16le", "-"
+    ]
+
+    res = subprocess.run(
+        cmd,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    # Convert once and scale in place, so only one float32 copy is ever held
+    audio = np.frombuffer(res.stdout, dtype=np.int16).astype(np.float32)
+    audio *= 1 / 32768
+    return audio
+
 
 def get_model_size(model):
     """
@@ -69,10 +130,9 @@ def format_timestamp(seconds):
     """
     Convert seconds to SRT timestamp format (HH:MM:SS,mmm)
     """
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int((seconds % 1) * 1000)
+    minutes, millis = divmod(int(seconds * 1000), 60000)
+    hours, minutes = divmod(minutes, 60)
+    secs, millis = divmod(millis, 1000)
     return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
 
 
@@ -82,16 +142,11 @@ def generate_subtitle(video_file, subtitle_file):
     Returns True if successful, False otherwise.
     """
     try:
-        from faster_whisper import WhisperModel
+        model = load_whisper_model()
         
-        print(f"  Loading Faster-Whisper model '{WHISPER_MODEL}'...")
-        print(f"  (If this is first time, downloading ~{get_model_size(WHISPER_MODEL)}...)")
-        # Use int8 for CPU efficiency, or "float16" for GPU
-        model = WhisperModel(WHISPER_MODEL, device="cpu", compute_type="int8")
-        
-        print("  ✅ Model loaded. Transcribing audio...")
+        print("  Transcribing audio...")
         start_time = time.time()
-        segments, info = model.transcribe(video_file, language=None)
+        segments, info = model.transcribe(video_file, language=None, **TRANSCRIBE_OPTIONS)
         
         # Collect segments with simple progress
         segments_list = []
@@ -109,17 +164,53 @@ def generate_subtitle(video_file, subtitle_file):
         
         # Generate SRT format
         print("  Generating subtitle file...")
-        with open(subtitle_file, "w", encoding="utf-8") as f:
-            for i, segment in enumerate(segments_list, start=1):
-                seg_start = format_timestamp(segment.start)
-                seg_end = format_timestamp(segment.end)
-                text = segment.text.strip()
-                
-                f.write(f"{i}\n")
-                f.write(f"{seg_start} --> {seg_end}\n")
-                f.write(f"{text}\n\n")
+        write_srt(
+            ((segment.start, segment.end, segment.text) for segment in segments_list),
+            subtitle_file
+        )
         
         return True
     except Exception as e:
         print(f"  Failed to generate subtitle: {str(e)}")
         return False
+
+
+def write_srt(entries, subtitle_file):
+    """
+    Write (start, end, text) entries to an SRT subtitle file.
+    """
+    # Build the whole file in memory and write it in one call
+    parts = [
+        f"{i}\n{format_timestamp(start)} --> {format_timestamp(end)}\n{text.strip()}\n\n"
+        for i, (start, end, text) in enumerate(entries, start=1)
+    ]
+    with open(subtitle_file, "w", encoding="utf-8") as f:
+        f.write("".join(parts))
+
+
+def slice_srt(full_segments, clip_start, clip_end, subtitle_file):
+    """
+    Write the part of a full-video transcript that overlaps a clip
+    as an SRT file, with timestamps rebased to the clip start.
+    Returns True if at least one segment was written, False otherwise.
+    """
+    clip_length = clip_end - clip_start
+    entries = [
+        (
+            max(0, segment.start - clip_start),
+            min(clip_length, segment.end - clip_start),
+            segment.text
+        )
+        for segment in full_segments
+        if segment.end > clip_start and segment.start < clip_end
+    ]
+    
+    if not entries:
+        return False
+    
+    try:
+        write_srt(entries, subtitle_file)
+        return True
+    except Exception as e:
+        print(f"  Failed to write subtitle: {str(e)}")
+        return False
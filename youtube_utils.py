@@ -1,21 +1,175 @@
 """
 YouTube utilities for video ID extraction, heatmap fetching, and duration retrieval.
 """
-import sys
+import os
 import re
 import json
-import subprocess
-import requests
-from urllib.parse import urlparse, parse_qs
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+import urllib3
+import numpy as np
+from urllib.parse import urlparse
 
-from config import MIN_SCORE, MAX_DURATION
+try:
+    import simdjson
+    HAS_SIMDJSON = True
+except ImportError:
+    HAS_SIMDJSON = False
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    from diskcache import Cache
+    HAS_DISKCACHE = True
+except ImportError:
+    HAS_DISKCACHE = False
+
+from config import MIN_SCORE, MAX_DURATION, CACHE_DIR, CACHE_EXPIRE
+
+# A high-engagement segment, in seconds; method records which detector found it
+Marker = namedtuple("Marker", "start duration score method", defaults=("heatmap",))
+
+# yt-dlp format selector for clip sources (separate video+audio or a muxed mp4)
+STREAM_FORMAT = "bestvideo[height<=1080][ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best"
+
+
+class _QuietLogger:
+    """
+    Swallow yt-dlp's console output; failures still surface as exceptions.
+    """
+    def debug(self, msg):
+        pass
+
+    def warning(self, msg):
+        pass
+
+    def error(self, msg):
+        pass
+
+
+# In-process yt-dlp options, matching the previous
+# "--force-ipv4 --quiet --no-warnings" command line flags
+YDL_OPTIONS = {
+    "source_address": "0.0.0.0",
+    "quiet": True,
+    "no_warnings": True,
+    "logger": _QuietLogger(),
+}
+
+# URL prefixes that are directly followed by the video ID
+_ID_PREFIXES = (
+    "https://www.youtube.com/watch?v=",
+    "https://youtube.com/watch?v=",
+    "https://youtu.be/",
+    "https://www.youtu.be/",
+    "https://www.youtube.com/shorts/",
+    "https://youtube.com/shorts/",
+)
+_ID_LENGTH = 11
+
+# Video IDs are always 11 URL-safe base64 characters
+_VID_RE = re.compile(r"[A-Za-z0-9_-]{11}")
+
+# Durations read from watch pages already fetched by ambil_most_replayed
+_duration_cache = {}
+_LENGTH_RE = re.compile(rb'"lengthSeconds":"(\d+)"')
+
+# Key of the heatmap markers array embedded in the watch page
+_MARKERS_KEY = b'"markers":'
+
+# Appears right after the markers array, so the rest of the page can be skipped
+_MARKERS_END = b"markersMetadata"
+_CHUNK_SIZE = 65536
+
+# One marker's start, duration and score, in page order. Tolerates quoted
+# numbers, escaped quotes and prefixed keys such as timeRangeStartMillis.
+_MARKER_RE = re.compile(
+    rb'[sS]tartMillis\\?":\\?"?(\d+)\\?"?,'
+    rb'\\?"\w*[dD]urationMillis\\?":\\?"?(\d+)\\?"?,'
+    rb'\\?"\w*[sS]coreNormalized\\?":\\?"?([\d.eE+-]+)'
+)
+
+# Connections kept per host; also the thread count of ambil_most_replayed_batch
+BATCH_WORKERS = 8
+
+# Shared connection pool, so repeat page fetches reuse the kept-alive connection
+_POOL = urllib3.PoolManager(
+    headers=urllib3.make_headers(user_agent="Mozilla/5.0", accept_encoding="gzip,deflate"),
+    maxsize=BATCH_WORKERS
+)
+
+# simdjson parsers are not thread-safe, so each thread gets its own
+_LOCAL = threading.local()
+
+# Shared metadata-only extractor, so lookups don't pay yt-dlp startup each time
+# (created on first use, so yt-dlp is only imported after run.py may have upgraded it)
+_YDL = None
+_YDL_LOCK = threading.Lock()
+
+# On-disk cache of heatmap and duration lookups, shared across runs.
+# Set YT_HEATMAP_NOCACHE=1 to bypass it.
+_CACHE = None
+if HAS_DISKCACHE and os.environ.get("YT_HEATMAP_NOCACHE") != "1":
+    try:
+        _CACHE = Cache(os.path.join(CACHE_DIR, "lookups"))
+    except Exception:
+        _CACHE = None
+
+
+def _cache_get(key):
+    """
+    Read a value from the on-disk cache, or None if missing or disabled.
+    """
+    if _CACHE is None:
+        return None
+    try:
+        return _CACHE.get(key)
+    except Exception:
+        return None
+
+
+def _cache_set(key, value):
+    """
+    Store a value in the on-disk cache for CACHE_EXPIRE seconds.
+    """
+    if _CACHE is None:
+        return
+    try:
+        _CACHE.set(key, value, expire=CACHE_EXPIRE)
+    except Exception:
+        pass
 
 
 def extract_video_id(url):
     """
     Extract the YouTube video ID from a given URL.
     Supports standard YouTube URLs, shortened URLs, and Shorts URLs.
+    Returns None if the URL does not hold a well-formed video ID.
+    """
+    video_id = _parse_video_id(url)
+    if video_id and _VID_RE.fullmatch(video_id):
+        return video_id
+    return None
+
+
+def _parse_video_id(url):
+    """
+    Pull the raw video ID candidate out of a URL, without validating it.
     """
+    # Fast path: the common URL shapes need only a prefix check and a slice
+    for prefix in _ID_PREFIXES:
+        if url.startswith(prefix):
+            end = len(prefix) + _ID_LENGTH
+            if len(url) == end or (len(url) > end and url[end] in "?&#/"):
+                return url[len(prefix):end]
+            break
+
     parsed = urlparse(url)
 
     if parsed.hostname in ("youtu.be", "www.youtu.be"):
@@ -23,91 +177,362 @@ def extract_video_id(url):
 
     if parsed.hostname in ("youtube.com", "www.youtube.com"):
         if parsed.path == "/watch":
-            return parse_qs(parsed.query).get("v", [None])[0]
+            for param in parsed.query.split("&"):
+                if param.startswith("v="):
+                    return param[2:]
+            return None
         if parsed.path.startswith("/shorts/"):
             return parsed.path.split("/")[2]
 
     return None
 
 
+def _get_ydl():
+    """
+    Return the shared metadata-only extractor, creating it on first use.
+    Callers must hold _YDL_LOCK.
+    """
+    global _YDL
+    if _YDL is None:
+        from yt_dlp import YoutubeDL
+        _YDL = YoutubeDL(dict(YDL_OPTIONS, skip_download=True))
+    return _YDL
+
+
 def get_duration(video_id):
     """
     Retrieve the total duration of a YouTube video in seconds.
+    Uses the duration found on the watch page when it was already fetched,
+    then the on-disk cache, before asking yt-dlp.
     """
-    cmd = [
-        sys.executable,
-        "-m",
-        "yt_dlp",
-        "--get-duration",
-        f"https://youtu.be/{video_id}"
-    ]
+    if video_id in _duration_cache:
+        return _duration_cache[video_id]
+
+    cached = _cache_get(("duration", video_id))
+    if cached is not None:
+        return cached
 
     try:
-        res = subprocess.run(cmd, capture_output=True, text=True)
-        time_parts = res.stdout.strip().split(":")
-
-        if len(time_parts) == 2:
-            return int(time_parts[0]) * 60 + int(time_parts[1])
-        if len(time_parts) == 3:
-            return (
-                int(time_parts[0]) * 3600 +
-                int(time_parts[1]) * 60 +
-                int(time_parts[2])
-            )
+        with _YDL_LOCK:
+            info = _get_ydl().extract_info(f"https://youtu.be/{video_id}", download=False)
     except Exception:
-        pass
+        return 3600
 
-    return 3600
+    if not info.get("duration"):
+        return 3600
 
+    duration = int(info["duration"])
+    _cache_set(("duration", video_id), duration)
+    return duration
 
-def ambil_most_replayed(video_id):
+
+def get_audio_url(video_id):
     """
-    Fetch and parse YouTube 'Most Replayed' heatmap data.
-    Returns a list of high-engagement segments.
+    Resolve the direct URL of a YouTube video's best audio stream.
     """
-    url = f"https://www.youtube.com/watch?v={video_id}"
-    headers = {"User-Agent": "Mozilla/5.0"}
+    from yt_dlp import YoutubeDL
 
-    print("Reading YouTube heatmap data...")
+    options = dict(YDL_OPTIONS, format="bestaudio[ext=m4a]/bestaudio")
+    with YoutubeDL(options) as ydl:
+        info = ydl.extract_info(f"https://youtu.be/{video_id}", download=False)
+    return info["url"]
+
+
+def download_source(video_id, output_file):
+    """
+    Download the full source video once so every clip can be cut locally.
+    Returns True if the file was downloaded, False otherwise.
+    """
+    from yt_dlp import YoutubeDL
+    from yt_dlp.utils import DownloadError
+
+    options = dict(
+        YDL_OPTIONS,
+        format=STREAM_FORMAT,
+        merge_output_format="mp4",
+        outtmpl=output_file,
+        # A leftover file from an interrupted run must never be reused
+        overwrites=True
+    )
+
+    try:
+        with YoutubeDL(options) as ydl:
+            ydl.download([f"https://youtu.be/{video_id}"])
+    except DownloadError as e:
+        print(f"Error details: {str(e)}")
+        return False
+
+    return os.path.exists(output_file)
+
+
+def _fetch_page(url):
+    """
+    Stream the watch page and stop reading once the markers array has
+    been received. Returns the raw bytes read so far (the whole page if
+    the markers never appear), without decoding them to text.
+    Returns None if YouTube answered with anything but 200 OK
+    (rate limiting, consent or bot-check pages).
+    """
+    buf = bytearray()
+    complete = True
+    r = _POOL.request("GET", url, timeout=20, preload_content=False)
+    if r.status != 200:
+        r.close()
+        return None
+
+    try:
+        for chunk in r.stream(_CHUNK_SIZE):
+            # Only the new chunk (plus an overlap for a split sentinel) needs searching
+            tail = max(0, len(buf) - len(_MARKERS_END))
+            buf += chunk
+            if buf.find(_MARKERS_END, tail) != -1:
+                complete = False
+                break
+    finally:
+        if complete:
+            r.release_conn()
+        else:
+            # The rest of the body is unread, so the connection can't be reused
+            r.close()
+    return buf
+
+
+def _match_bracket(data, start):
+    """
+    Return the index of the ']' that closes the '[' at data[start], or -1.
+    Jumps between bracket positions with bytes.find instead of
+    stepping through every byte.
+    """
+    depth = 0
+    i = start
+    next_open = start
+    while True:
+        if next_open != -1 and next_open < i:
+            next_open = data.find(b"[", i)
+        close = data.find(b"]", i)
+        if close == -1:
+            return -1
+
+        if next_open != -1 and next_open < close:
+            depth += 1
+            i = next_open + 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return close
+            i = close + 1
+
+
+def _find_markers(html):
+    """
+    Locate the markers JSON array in the watch page bytes.
+    Accepts the array only when it is followed by "markersMetadata".
+    Returns the array bytes, or None if not found.
+    """
+    # Videos without Most Replayed data miss the sentinel; skip the scan entirely
+    if _MARKERS_END not in html:
+        return None
+
+    pos = html.find(_MARKERS_KEY)
+    while pos != -1:
+        start = pos + len(_MARKERS_KEY)
+        while start < len(html) and html[start] in b" \t\r\n":
+            start += 1
+
+        if html.startswith(b"[", start):
+            end = _match_bracket(html, start)
+            if end != -1:
+                tail = html[end + 1:end + 64].lstrip()
+                if tail.startswith(b",") and tail[1:].lstrip().lstrip(b'\\"').startswith(b"markersMetadata"):
+                    return html[start:end + 1]
+
+        pos = html.find(_MARKERS_KEY, pos + 1)
+
+    return None
+
+
+def _parse_markers(blob):
+    """
+    Parse the embedded markers JSON array.
+    With simdjson the markers are decoded lazily, so only the fields that
+    are actually read get materialized; otherwise orjson is preferred over
+    the standard json module. Returns None if parsing fails.
+    """
+    if HAS_SIMDJSON:
+        try:
+            parser = getattr(_LOCAL, "parser", None)
+            if parser is None:
+                parser = _LOCAL.parser = simdjson.Parser()
+            return parser.parse(blob)
+        except Exception:
+            pass
 
+    loads = orjson.loads if HAS_ORJSON else json.loads
     try:
-        html = requests.get(url, headers=headers, timeout=20).text
+        return loads(blob.replace(b'\\"', b'"'))
     except Exception:
-        return []
+        return None
+
+
+def _to_float(value):
+    """
+    Convert a marker value to float, mapping null or malformed values to NaN.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
 
-    match = re.search(
-        r'"markers":\s*(\[.*?\])\s*,\s*"?markersMetadata"?',
-        html,
-        re.DOTALL
+
+def _marker_field(markers, name, default):
+    """
+    Collect one numeric field of every marker into a float64 array.
+    """
+    return np.fromiter(
+        (_to_float(m.get(name, default)) for m in markers),
+        dtype=np.float64,
+        count=len(markers)
     )
 
-    if not match:
-        return []
+
+def _marker_arrays(blob):
+    """
+    Extract start, duration and score arrays (milliseconds / raw score)
+    from the markers JSON array. A single regex pass handles the usual
+    layout; anything else goes through the JSON parser.
+    Returns None if the markers can't be read.
+    """
+    found = _MARKER_RE.findall(blob)
+    if found:
+        try:
+            fields = np.array(found).astype(np.float64)
+            return fields[:, 0], fields[:, 1], fields[:, 2]
+        except ValueError:
+            pass
+
+    markers = _parse_markers(blob)
+    if markers is None:
+        return None
+
+    # Pages use one marker format throughout, so check the first marker only
+    wrapped = len(markers) > 0 and "heatMarkerRenderer" in markers[0]
+
+    # One flat array per field; missing or malformed values become NaN and
+    # those markers are dropped by the isfinite mask in ambil_most_replayed
+    try:
+        if wrapped:
+            markers = [m["heatMarkerRenderer"] for m in markers]
+        starts = _marker_field(markers, "startMillis", "nan")
+        durations = _marker_field(markers, "durationMillis", "nan")
+        scores = _marker_field(markers, "intensityScoreNormalized", 0)
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+    return starts, durations, scores
+
+
+def _top_order(scores, top_k=None):
+    """
+    Indices of the top_k highest scores (all if top_k is None), highest
+    first. Ties keep page order, exactly like a full stable sort.
+    """
+    n = len(scores)
+    if top_k is None or top_k >= n:
+        return np.argsort(-scores, kind="stable")
+    if top_k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    # Partial selection finds the cutoff score in O(n) instead of sorting everything
+    threshold = np.partition(scores, n - top_k)[n - top_k]
+    above = np.flatnonzero(scores > threshold)
+    ties = np.flatnonzero(scores == threshold)[:top_k - len(above)]
+    chosen = np.sort(np.concatenate((above, ties)))
+    return chosen[np.argsort(-scores[chosen], kind="stable")]
+
+
+def _heatmap_fields(video_id):
+    """
+    Fetch the watch page and return the raw (start, duration, score) marker
+    arrays, before any MIN_SCORE/MAX_DURATION filtering. Returns None on
+    failure. The arrays are kept in the on-disk cache for CACHE_EXPIRE
+    seconds, so config changes still apply to cached videos.
+    """
+    cache_key = ("markers", video_id)
+
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
 
     try:
-        markers = json.loads(match.group(1).replace('\\"', '"'))
+        html = _fetch_page(f"https://www.youtube.com/watch?v={video_id}")
     except Exception:
+        return None
+
+    if html is None:
+        return None
+
+    # The watch page also carries the video length, which saves a yt-dlp lookup
+    length = _LENGTH_RE.search(html)
+    if length:
+        _duration_cache[video_id] = int(length.group(1))
+        _cache_set(("duration", video_id), _duration_cache[video_id])
+
+    blob = _find_markers(html)
+
+    if blob is None:
+        # Only remember "no heatmap" for what is clearly a real watch page
+        if length:
+            empty = np.empty(0, dtype=np.float64)
+            _cache_set(cache_key, (empty, empty, empty))
+        return None
+
+    fields = _marker_arrays(blob)
+    if fields is not None:
+        _cache_set(cache_key, fields)
+    return fields
+
+
+def ambil_most_replayed(video_id, top_k=None):
+    """
+    Fetch and parse YouTube 'Most Replayed' heatmap data.
+    Returns a list of Marker segments, highest score first; with top_k,
+    only the top_k best segments are ranked and returned.
+    """
+    print("Reading YouTube heatmap data...")
+
+    fields = _heatmap_fields(video_id)
+    if fields is None:
         return []
 
-    results = []
+    starts, durations, scores = fields
+    mask = (scores >= MIN_SCORE) & np.isfinite(starts) & np.isfinite(durations)
+    starts = starts[mask] / 1000
+    durations = np.minimum(durations[mask] / 1000, MAX_DURATION)
+    scores = scores[mask]
 
-    for marker in markers:
-        if "heatMarkerRenderer" in marker:
-            marker = marker["heatMarkerRenderer"]
+    order = _top_order(scores, top_k)
+
+    return list(map(
+        Marker,
+        starts[order].tolist(),
+        durations[order].tolist(),
+        scores[order].tolist()
+    ))
+
+
+def _fetch_video(video_id, top_k=None):
+    """
+    Fetch the heatmap and duration of one video for ambil_most_replayed_batch.
+    """
+    markers = ambil_most_replayed(video_id, top_k)
+    return video_id, markers, get_duration(video_id)
 
-        try:
-            score = float(marker.get("intensityScoreNormalized", 0))
-            if score >= MIN_SCORE:
-                results.append({
-                    "start": float(marker["startMillis"]) / 1000,
-                    "duration": min(
-                        float(marker["durationMillis"]) / 1000,
-                        MAX_DURATION
-                    ),
-                    "score": score
-                })
-        except Exception:
-            continue
 
-    results.sort(key=lambda x: x["score"], reverse=True)
-    return results
+def ambil_most_replayed_batch(video_ids, max_workers=BATCH_WORKERS, top_k=None):
+    """
+    Fetch heatmap data and durations for several videos concurrently.
+    The duration normally comes from the same watch page fetch.
+    Returns a list of (video_id, markers, duration) in input order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_fetch_video, video_ids, repeat(top_k)))